@@ -5,28 +5,24 @@ This script shows the difference between cramming everything into one message
 vs properly separating system context from user requests.
 """
 
-from os import getenv
+import argparse
+import asyncio
 
-from dotenv import load_dotenv
-from litellm import completion
-
-
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
-
-
-# Load environment variables
-load_dotenv()
+from _common import (
+    LLAMA_8B,
+    acached_completion,
+    blue_print,
+    gpt_oss_stream,
+    run_batch,
+)
 
 
 def bad_approach():
     """Bad: Everything crammed into one message"""
     print("=== BAD APPROACH ===")
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    print("Query fix (bad approach):")
+    gpt_oss_stream(
         messages=[
             {
                 "role": "user",
@@ -34,9 +30,6 @@ def bad_approach():
             }
         ],
     )
-
-    print("Query fix (bad approach):")
-    blue_print(response["choices"][0]["message"]["content"])
     print("\n" + "=" * 50 + "\n")
 
 
@@ -44,9 +37,8 @@ def good_approach():
     """Good: Clear separation of concerns"""
     print("=== GOOD APPROACH ===")
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    print("Query fix (good approach):")
+    gpt_oss_stream(
         messages=[
             {
                 "role": "system",
@@ -59,11 +51,8 @@ def good_approach():
         ],
     )
 
-    print("Query fix (good approach):")
-    blue_print(response["choices"][0]["message"]["content"])
-
 
-def compare_approaches():
+async def compare_approaches(batch: bool = False):
     """Compare different system prompt strategies"""
     test_query = (
         "SELECT * FROM orders o, users u WHERE o.user_id = u.id AND o.total > 1000"
@@ -78,24 +67,51 @@ def compare_approaches():
     }
 
     print("=== SYSTEM PROMPT COMPARISON ===")
-    for approach_name, system_prompt in approaches.items():
-        print(f"\n--- {approach_name} System Prompt ---")
 
-        response = completion(
-            model="openrouter/meta-llama/llama-3.1-8b-instruct",
-            api_key=getenv("OPENROUTER_API_KEY"),
-            messages=[
+    requests = {
+        approach_name: {
+            "model": LLAMA_8B,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Optimize this query: {test_query}"},
             ],
-            temperature=0.3,
-        )
+            "temperature": 0.3,
+        }
+        for approach_name, system_prompt in approaches.items()
+    }
 
-        blue_print(response["choices"][0]["message"]["content"])
+    if batch:
+        results = await asyncio.to_thread(run_batch, requests)
+    else:
+        # The calls are independent, so fire them all at once and print in order
+        tasks = [acached_completion(**request) for request in requests.values()]
+        responses = await asyncio.gather(*tasks, return_exceptions=True)
+        results = {
+            approach_name: response
+            if isinstance(response, Exception)
+            else response["choices"][0]["message"]["content"]
+            for approach_name, response in zip(requests, responses, strict=True)
+        }
+
+    for approach_name, result in results.items():
+        print(f"\n--- {approach_name} System Prompt ---")
+
+        if isinstance(result, Exception):
+            print(f"Error: {result}")
+        else:
+            blue_print(result)
         print("\n" + "=" * 50 + "\n")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="run the system prompt comparison through the OpenAI Batch API",
+    )
+    args = parser.parse_args()
+
     print("System vs User Prompts Demo\n")
 
     # Demonstrate the difference
@@ -103,4 +119,4 @@ if __name__ == "__main__":
     good_approach()
 
     # Compare different system prompt strategies
-    compare_approaches()
+    asyncio.run(compare_approaches(batch=args.batch))
@@ -5,107 +5,129 @@ This script demonstrates how providing examples dramatically improves
 LLM performance compared to just giving instructions.
 """
 
-from os import getenv
-
-from dotenv import load_dotenv
-from litellm import completion
+import argparse
+import asyncio
+from functools import lru_cache, partial
+
+from _common import (
+    GPT_OSS_20B,
+    acached_completion,
+    blue_print,
+    gpt_oss,
+    run_batch,
+)
+
+# Few-shot examples live in the system prompt rather than as replayed
+# user/assistant turns, so every query reuses the same cacheable prefix
+FEW_SHOT_SYSTEM_PROMPT = """Extract SQL queries from natural language. Return only valid SQL.
+
+EXAMPLES:
+Q: Show me all users from Texas
+A: SELECT * FROM users WHERE state = 'TX';
+
+Q: Count orders from last month
+A: SELECT COUNT(*) FROM orders WHERE date >= DATE_SUB(CURDATE(), INTERVAL 1 MONTH);
+
+Q: Find users who joined this year
+A: SELECT * FROM users WHERE YEAR(created_at) = YEAR(CURDATE());
+"""
 
+# Context-aware examples for the schema-based variant, placed after the schema
+CONTEXT_AWARE_EXAMPLES = """EXAMPLES:
+Q: Show high-value customers
+A: SELECT customer_id, name, total_spent FROM customers WHERE total_spent > 10000 ORDER BY total_spent DESC;
 
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
+Q: Find recent orders that are still processing
+A: SELECT order_id, customer_id, created_at FROM orders WHERE status = 'processing' AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY);
+"""
 
 
-# Load environment variables
-load_dotenv()
+@lru_cache(maxsize=32)
+def _render_schema(schema_items: tuple) -> str:
+    """Render the schema once per distinct schema, byte-identical every time"""
+    return "Available tables and columns:\n" + "".join(
+        f"- {table}: {', '.join(columns)}\n" for table, columns in schema_items
+    )
 
 
-def zero_shot_approach(user_query: str) -> str:
+def zero_shot_request(user_query: str) -> dict:
     """Zero-shot: Just instructions, no examples"""
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
-        messages=[
+    return {
+        "model": GPT_OSS_20B,
+        "messages": [
             {
                 "role": "system",
                 "content": "Extract SQL queries from natural language. Return only valid SQL.",
             },
             {"role": "user", "content": user_query},
         ],
-    )
-
-    return response["choices"][0]["message"]["content"]
+    }
 
 
-def few_shot_approach(user_query: str) -> str:
+def few_shot_request(user_query: str) -> dict:
     """Few-shot: Provide examples to establish the pattern"""
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
-        messages=[
-            {
-                "role": "system",
-                "content": "Extract SQL queries from natural language. Return only valid SQL.",
-            },
-            # Few-shot examples
-            {"role": "user", "content": "Show me all users from Texas"},
-            {"role": "assistant", "content": "SELECT * FROM users WHERE state = 'TX';"},
-            {"role": "user", "content": "Count orders from last month"},
-            {
-                "role": "assistant",
-                "content": "SELECT COUNT(*) FROM orders WHERE date >= DATE_SUB(CURDATE(), INTERVAL 1 MONTH);",
-            },
-            {"role": "user", "content": "Find users who joined this year"},
-            {
-                "role": "assistant",
-                "content": "SELECT * FROM users WHERE YEAR(created_at) = YEAR(CURDATE());",
-            },
+    return {
+        "model": GPT_OSS_20B,
+        "messages": [
+            # Instructions and examples form one prefix shared by every query
+            {"role": "system", "content": FEW_SHOT_SYSTEM_PROMPT},
             # Actual query
             {"role": "user", "content": user_query},
         ],
-    )
-
-    return response["choices"][0]["message"]["content"]
+    }
 
 
-def advanced_few_shot_with_context(user_query: str, table_schema: dict) -> str:
+def advanced_few_shot_request(user_query: str, table_schema: dict) -> dict:
     """Advanced few-shot with schema context"""
 
-    schema_info = "Available tables and columns:\n"
-    for table, columns in table_schema.items():
-        schema_info += f"- {table}: {', '.join(columns)}\n"
+    schema_info = _render_schema(
+        tuple(
+            sorted((table, tuple(columns)) for table, columns in table_schema.items())
+        )
+    )
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
-        messages=[
+    return {
+        "model": GPT_OSS_20B,
+        "messages": [
             {
                 "role": "system",
-                "content": f"You are a SQL expert. Generate queries based on the schema.\n\n{schema_info}",
-            },
-            # Context-aware examples
-            {"role": "user", "content": "Show high-value customers"},
-            {
-                "role": "assistant",
-                "content": "SELECT customer_id, name, total_spent FROM customers WHERE total_spent > 10000 ORDER BY total_spent DESC;",
-            },
-            {"role": "user", "content": "Find recent orders that are still processing"},
-            {
-                "role": "assistant",
-                "content": "SELECT order_id, customer_id, created_at FROM orders WHERE status = 'processing' AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY);",
+                "content": "You are a SQL expert. Generate queries based on the schema.\n\n"
+                f"{schema_info}\n{CONTEXT_AWARE_EXAMPLES}",
             },
             # Actual query
             {"role": "user", "content": user_query},
         ],
-        temperature=0.2,
-    )
+        "temperature": 0.2,
+    }
+
 
+async def _answer(request: dict) -> str:
+    """Answer text for a request built by one of the builders above"""
+    response = await acached_completion(**request)
     return response["choices"][0]["message"]["content"]
 
 
-def compare_approaches():
+async def zero_shot_approach(user_query: str) -> str:
+    """Zero-shot: Just instructions, no examples"""
+    request = zero_shot_request(user_query)
+    return await _answer(request)
+
+
+async def few_shot_approach(user_query: str) -> str:
+    """Few-shot: Provide examples to establish the pattern"""
+    request = few_shot_request(user_query)
+    return await _answer(request)
+
+
+async def advanced_few_shot_with_context(user_query: str, table_schema: dict) -> str:
+    """Advanced few-shot with schema context"""
+    request = advanced_few_shot_request(user_query, table_schema)
+    return await _answer(request)
+
+
+async def compare_approaches(batch: bool = False):
     """Compare zero-shot vs few-shot performance"""
 
     test_queries = [
@@ -130,33 +152,47 @@ def compare_approaches():
         "employees": ["employee_id", "name", "department", "start_date", "salary"],
     }
 
+    # Label -> (request builder for --batch, approach for interactive runs)
+    approaches = {
+        "Zero-shot result:": (zero_shot_request, zero_shot_approach),
+        "Few-shot result:": (few_shot_request, few_shot_approach),
+        "Advanced few-shot with schema:": (
+            partial(advanced_few_shot_request, table_schema=schema),
+            partial(advanced_few_shot_with_context, table_schema=schema),
+        ),
+    }
+
     print("=== ZERO-SHOT vs FEW-SHOT COMPARISON ===\n")
 
+    # Every (query, approach) pair is independent: dispatch all of them at once
+    slots = {
+        f"query-{i}-approach-{j}": (query, build_request, approach)
+        for i, query in enumerate(test_queries, 1)
+        for j, (build_request, approach) in enumerate(approaches.values(), 1)
+    }
+
+    if batch:
+        requests = {
+            slot: build_request(query)
+            for slot, (query, build_request, _) in slots.items()
+        }
+        results = await asyncio.to_thread(run_batch, requests)
+    else:
+        tasks = [approach(query) for query, _, approach in slots.values()]
+        responses = await asyncio.gather(*tasks, return_exceptions=True)
+        results = dict(zip(slots, responses, strict=True))
+
     for i, query in enumerate(test_queries, 1):
         print(f"Query {i}: '{query}'")
         print("-" * 50)
 
-        # Zero-shot
-        print("Zero-shot result:")
-        try:
-            zero_result = zero_shot_approach(query)
-            blue_print(zero_result)
-        except Exception as e:
-            print(f"Error: {e}")
-
-        print("\nFew-shot result:")
-        try:
-            few_result = few_shot_approach(query)
-            blue_print(few_result)
-        except Exception as e:
-            print(f"Error: {e}")
-
-        print("\nAdvanced few-shot with schema:")
-        try:
-            advanced_result = advanced_few_shot_with_context(query, schema)
-            blue_print(advanced_result)
-        except Exception as e:
-            print(f"Error: {e}")
+        for j, label in enumerate(approaches, 1):
+            print(label if j == 1 else f"\n{label}")
+            result = results[f"query-{i}-approach-{j}"]
+            if isinstance(result, Exception):
+                print(f"Error: {result}")
+            else:
+                blue_print(result)
 
         print("\n" + "=" * 70 + "\n")
 
@@ -218,9 +254,7 @@ def demonstrate_pattern_learning():
         # Add test query
         messages.append({"role": "user", "content": pattern_data["test"]})
 
-        response = completion(
-            model="openrouter/openai/gpt-oss-20b:free",
-            api_key=getenv("OPENROUTER_API_KEY"),
+        response = gpt_oss(
             messages=messages,
             temperature=0.1,
         )
@@ -232,10 +266,18 @@ def demonstrate_pattern_learning():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="run the zero-shot vs few-shot comparison through the OpenAI Batch API",
+    )
+    args = parser.parse_args()
+
     print("Few-Shot Learning Demo\n")
 
     # Main comparison
-    compare_approaches()
+    asyncio.run(compare_approaches(batch=args.batch))
 
     # Pattern learning demonstration
     demonstrate_pattern_learning()
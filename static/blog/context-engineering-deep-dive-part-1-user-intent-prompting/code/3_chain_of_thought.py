@@ -5,24 +5,16 @@ This script demonstrates how to get LLMs to think step-by-step,
 providing transparency into their reasoning process.
 """
 
-import json
-from os import getenv
-
-from dotenv import load_dotenv
-from litellm import completion
-
-
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
-
-
-# Load environment variables
-load_dotenv()
+from _common import (
+    gpt_oss_stream,
+    json_dumps,
+    json_loads,
+    llama_70b_stream,
+)
 
 
 def analyze_query_performance(sql_query: str) -> dict:
-    """Analyze SQL query with step-by-step reasoning"""
+    """Analyze SQL query with step-by-step reasoning, parsed from a JSON response"""
 
     cot_prompt = f"""
     Analyze this SQL query step by step:
@@ -34,12 +26,13 @@ def analyze_query_performance(sql_query: str) -> dict:
     3. Spot potential N+1 problems
     4. Suggest optimizations
 
-    Show your reasoning for each step.
+    Show your reasoning for each step in one short sentence.
+
+    Respond as JSON: {{"reasoning": ["one entry per step"], "tables": [...],
+    "missing_indexes": [...], "n_plus_one": true/false, "optimizations": [...]}}
     """
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    return gpt_oss_stream(
         messages=[
             {
                 "role": "system",
@@ -48,15 +41,15 @@ def analyze_query_performance(sql_query: str) -> dict:
             {"role": "user", "content": cot_prompt},
         ],
         temperature=0.2,  # Lower temperature for more focused reasoning
+        response_format={"type": "json_object"},
+        parse=json_loads,
     )
 
-    return {"analysis": response["choices"][0]["message"]["content"]}
-
 
 def debug_slow_query(query: str, execution_stats: dict) -> dict:
-    """Debug a slow query using chain-of-thought reasoning"""
+    """Debug a slow query using chain-of-thought reasoning, parsed from a JSON response"""
 
-    stats_text = json.dumps(execution_stats, indent=2)
+    stats_text = json_dumps(execution_stats, indent=True)
 
     debug_prompt = f"""
     I have a slow SQL query that needs debugging. Let me walk through this systematically.
@@ -87,12 +80,14 @@ def debug_slow_query(query: str, execution_stats: dict) -> dict:
     - How much improvement can we expect?
     - What are the trade-offs?
 
-    Think through each step carefully and show your reasoning.
+    Think through each step carefully and show your reasoning in one short sentence per step.
+
+    Respond as JSON: {{"reasoning": ["one entry per step"], "bottlenecks": [...],
+    "missing_indexes": [...], "rewritten_query": "SQL", "expected_improvement": "...",
+    "trade_offs": [...]}}
     """
 
-    response = completion(
-        model="openrouter/meta-llama/llama-3.1-70b-instruct",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    return llama_70b_stream(
         messages=[
             {
                 "role": "system",
@@ -101,13 +96,13 @@ def debug_slow_query(query: str, execution_stats: dict) -> dict:
             {"role": "user", "content": debug_prompt},
         ],
         temperature=0.3,
+        response_format={"type": "json_object"},
+        parse=json_loads,
     )
 
-    return {"debug_analysis": response["choices"][0]["message"]["content"]}
-
 
 def design_database_schema(requirements: str) -> dict:
-    """Design database schema with explicit reasoning"""
+    """Design database schema with explicit reasoning, parsed from a JSON response"""
 
     design_prompt = f"""
     Design a database schema for these requirements:
@@ -137,12 +132,14 @@ def design_database_schema(requirements: str) -> dict:
     - How will this grow over time?
     - What are potential bottlenecks?
 
-    Show your reasoning for each step and provide the final schema.
+    Show your reasoning for each step in one short sentence and provide the final schema.
+
+    Respond as JSON: {{"reasoning": ["one entry per step"],
+    "tables": [{{"name": "...", "columns": [...], "indexes": [...]}}],
+    "relationships": [...], "scaling_notes": [...]}}
     """
 
-    response = completion(
-        model="openrouter/meta-llama/llama-3.1-70b-instruct",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    return llama_70b_stream(
         messages=[
             {
                 "role": "system",
@@ -151,9 +148,17 @@ def design_database_schema(requirements: str) -> dict:
             {"role": "user", "content": design_prompt},
         ],
         temperature=0.2,
+        response_format={"type": "json_object"},
+        parse=json_loads,
     )
 
-    return {"schema_design": response["choices"][0]["message"]["content"]}
+
+def run_analysis(label: str, analyze, *args):
+    """Run one chain-of-thought analysis, whose JSON reply streams as it arrives"""
+    try:
+        return analyze(*args)
+    except ValueError as e:
+        print(f"Error: {label} response is not valid JSON: {e}")
 
 
 def compare_reasoning_approaches():
@@ -173,23 +178,19 @@ def compare_reasoning_approaches():
 
     # Direct approach
     print("--- Direct Approach ---")
-    direct_response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    gpt_oss_stream(
         messages=[
             {"role": "system", "content": "You are a SQL expert. Optimize this query."},
             {"role": "user", "content": f"Optimize this query: {test_query}"},
         ],
         temperature=0.3,
     )
-    blue_print(direct_response["choices"][0]["message"]["content"])
 
     print("\n" + "=" * 60 + "\n")
 
     # Chain-of-thought approach
     print("--- Chain-of-Thought Approach ---")
-    cot_result = analyze_query_performance(test_query)
-    blue_print(cot_result["analysis"])
+    run_analysis("Query analysis", analyze_query_performance, test_query)
 
 
 def demonstrate_complex_reasoning():
@@ -208,8 +209,7 @@ def demonstrate_complex_reasoning():
         "filesort": True,
     }
 
-    debug_result = debug_slow_query(slow_query, execution_stats)
-    blue_print(debug_result["debug_analysis"])
+    run_analysis("Query debugging", debug_slow_query, slow_query, execution_stats)
 
     print("\n" + "=" * 60 + "\n")
 
@@ -226,8 +226,7 @@ def demonstrate_complex_reasoning():
     - Track user behavior and analytics
     """
 
-    design_result = design_database_schema(requirements)
-    blue_print(design_result["schema_design"])
+    run_analysis("Schema design", design_database_schema, requirements)
 
 
 if __name__ == "__main__":
@@ -5,25 +5,47 @@ This script demonstrates how detailed role definitions dramatically
 improve output quality compared to generic "expert" prompts.
 """
 
-from os import getenv
-
-from dotenv import load_dotenv
-from litellm import completion
-
-
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
-
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from litellm import token_counter
+
+from _common import (
+    GPT_OSS_20B,
+    blue_print,
+    cached_system_message,
+    gpt_oss,
+)
+
+# Static instructions go first so every role shares the same cacheable prompt
+# prefix; only the short role description that follows varies between calls.
+ANALYZER_INSTRUCTIONS = """
+Your approach:
+- Identify issues before suggesting fixes
+- Explain trade-offs, not just solutions
+- Consider the business context
+- Provide actionable recommendations
+
+Response format:
+1. ISSUES FOUND: [list]
+2. IMPACT: [business impact]
+3. RECOMMENDATIONS: [specific fixes]
+4. ALTERNATIVE APPROACHES: [if applicable]
+"""
 
-# Load environment variables
-load_dotenv()
+INDUSTRY_INSTRUCTIONS = """
+Consider industry-specific requirements:
+- Regulatory compliance
+- Performance characteristics
+- Business criticality
+- Risk tolerance
 
+Provide recommendations that fit this industry context.
+"""
 
-def create_expert_analyzer(expertise_level: str = "senior"):
-    """Create specialized SQL analyzer with detailed role definition"""
 
-    roles = {
+ROLES = MappingProxyType(
+    {
         "junior": """You are a junior developer learning SQL best practices.
         You focus on basic correctness and readability.
         You ask clarifying questions when unsure.""",
@@ -37,43 +59,10 @@ def create_expert_analyzer(expertise_level: str = "senior"):
         Clients expect practical, business-focused solutions that save money.
         You always consider the business impact of your technical recommendations.""",
     }
+)
 
-    def analyze(query: str, context: str = "") -> str:
-        system_prompt = f"""
-        {roles.get(expertise_level, roles["senior"])}
-
-        Your approach:
-        - Identify issues before suggesting fixes
-        - Explain trade-offs, not just solutions
-        - Consider the business context
-        - Provide actionable recommendations
-
-        Response format:
-        1. ISSUES FOUND: [list]
-        2. IMPACT: [business impact]
-        3. RECOMMENDATIONS: [specific fixes]
-        4. ALTERNATIVE APPROACHES: [if applicable]
-        """
-
-        response = completion(
-            model="openrouter/openai/gpt-oss-20b:free",
-            api_key=getenv("OPENROUTER_API_KEY"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Context: {context}\n\nQuery: {query}"},
-            ],
-            temperature=0.3,
-        )
-
-        return response["choices"][0]["message"]["content"]
-
-    return analyze
-
-
-def create_industry_specialist(industry: str):
-    """Create industry-specific database expert"""
-
-    industry_contexts = {
+INDUSTRY_CONTEXTS = MappingProxyType(
+    {
         "ecommerce": """You are a database architect specializing in e-commerce platforms.
         You've scaled systems from startup to handling Black Friday traffic.
         You understand inventory management, order processing, and customer analytics.
@@ -91,25 +80,70 @@ def create_industry_specialist(industry: str):
         Low latency and high availability are essential for player experience.
         Anti-cheat measures and data analytics drive your decisions.""",
     }
+)
 
-    def analyze_for_industry(query: str, context: str = "") -> str:
-        system_prompt = f"""
-        {industry_contexts.get(industry, industry_contexts["ecommerce"])}
+PERSONAS = MappingProxyType(
+    {
+        "Alex Chen": {
+            "title": "Senior Data Engineer",
+            "company": "TechCorp",
+            "experience": "12 years in high-scale systems",
+            "specialties": [
+                "Real-time analytics",
+                "Stream processing",
+                "Data pipelines",
+            ],
+            "previous_roles": ["Netflix", "Uber", "Airbnb"],
+            "achievements": "Built analytics platform handling 1B events/day",
+            "style": "Direct and practical, focuses on scalability",
+            "risk_tolerance": "Conservative with production changes",
+            "concerns": ["Performance", "Reliability", "Cost optimization"],
+        },
+        "Morgan Taylor": {
+            "title": "Lead Security Engineer",
+            "company": "SecureFinance",
+            "experience": "8 years in financial services security",
+            "specialties": ["SQL injection prevention", "Data privacy", "Compliance"],
+            "previous_roles": ["JPMorgan Chase", "Goldman Sachs"],
+            "achievements": "Zero security incidents in 3 years",
+            "style": "Methodical and thorough, questions everything",
+            "risk_tolerance": "Extremely risk-averse",
+            "concerns": ["Security", "Compliance", "Audit trails"],
+        },
+    }
+)
 
-        Consider industry-specific requirements:
-        - Regulatory compliance
-        - Performance characteristics
-        - Business criticality
-        - Risk tolerance
 
-        Provide recommendations that fit this industry context.
-        """
+def create_expert_analyzer(expertise_level: str = "senior"):
+    """Create specialized SQL analyzer with detailed role definition"""
 
-        response = completion(
-            model="openrouter/openai/gpt-oss-20b:free",
-            api_key=getenv("OPENROUTER_API_KEY"),
+    role_prompt = ROLES.get(expertise_level, ROLES["senior"])
+
+    def analyze(query: str, context: str = "") -> str:
+        response = gpt_oss(
             messages=[
-                {"role": "system", "content": system_prompt},
+                cached_system_message(ANALYZER_INSTRUCTIONS),
+                {"role": "system", "content": role_prompt},
+                {"role": "user", "content": f"Context: {context}\n\nQuery: {query}"},
+            ],
+            temperature=0.3,
+        )
+
+        return response["choices"][0]["message"]["content"]
+
+    return analyze
+
+
+def create_industry_specialist(industry: str):
+    """Create industry-specific database expert"""
+
+    industry_prompt = INDUSTRY_CONTEXTS.get(industry, INDUSTRY_CONTEXTS["ecommerce"])
+
+    def analyze_for_industry(query: str, context: str = "") -> str:
+        response = gpt_oss(
+            messages=[
+                cached_system_message(INDUSTRY_INSTRUCTIONS),
+                {"role": "system", "content": industry_prompt},
                 {"role": "user", "content": f"Context: {context}\n\nQuery: {query}"},
             ],
             temperature=0.2,
@@ -133,11 +167,17 @@ def demonstrate_role_differences():
 
     roles = ["junior", "senior", "security", "consultant"]
 
-    for role in roles:
+    # Each role is an independent network call, so run them side by side
+    with ThreadPoolExecutor(max_workers=len(roles)) as executor:
+        futures = [
+            executor.submit(create_expert_analyzer(role), vulnerable_query, context)
+            for role in roles
+        ]
+
+    for role, future in zip(roles, futures, strict=True):
         print(f"\n--- {role.upper()} PERSPECTIVE ---")
-        analyzer = create_expert_analyzer(role)
         try:
-            result = analyzer(vulnerable_query, context)
+            result = future.result()
             blue_print(result)
         except Exception as e:
             print(f"Error: {e}")
@@ -164,22 +204,25 @@ def demonstrate_industry_perspectives():
 
     industries = ["fintech", "ecommerce", "gaming", "healthcare"]
 
-    for industry in industries:
+    with ThreadPoolExecutor(max_workers=len(industries)) as executor:
+        futures = [
+            executor.submit(create_industry_specialist(industry), query, context)
+            for industry in industries
+        ]
+
+    for industry, future in zip(industries, futures, strict=True):
         print(f"\n--- {industry.upper()} INDUSTRY ---")
-        analyzer = create_industry_specialist(industry)
         try:
-            result = analyzer(query, context)
+            result = future.result()
             blue_print(result)
         except Exception as e:
             print(f"Error: {e}")
         print("-" * 40)
 
 
-def create_persona_with_background(name: str, background: dict):
-    """Create a detailed persona with specific background"""
-
-    def analyze_with_persona(query: str, context: str = "") -> str:
-        persona_prompt = f"""
+def verbose_persona_prompt(name: str, background: dict) -> str:
+    """The original multi-line persona, kept to measure what persona_prompt saves"""
+    return f"""
         You are {name}, a {background["title"]} at {background["company"]}.
 
         Background:
@@ -196,11 +239,32 @@ def create_persona_with_background(name: str, background: dict):
         Approach this analysis as {name} would, considering your background and personality.
         """
 
-        response = completion(
-            model="openrouter/openai/gpt-oss-20b:free",
-            api_key=getenv("OPENROUTER_API_KEY"),
+
+def persona_prompt(name: str, background: dict) -> str:
+    """One-line persona: the facts that shape the answer, without the prose
+
+    Previous roles and achievements stay in the persona data but are left
+    out here; they are flavour text the analysis never relies on.
+    """
+    return (
+        f"You are {name} | {background['title']} @ {background['company']} | "
+        f"{background['experience']} | "
+        f"specialties={', '.join(background['specialties'])} | "
+        f"concerns={', '.join(background['concerns'])} | "
+        f"style={background['style']} | risk={background['risk_tolerance']}. "
+        "Analyze as this person would."
+    )
+
+
+def create_persona_with_background(name: str, background: dict):
+    """Create a detailed persona with specific background"""
+
+    system_prompt = persona_prompt(name, background)
+
+    def analyze_with_persona(query: str, context: str = "") -> str:
+        response = gpt_oss(
             messages=[
-                {"role": "system", "content": persona_prompt},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Context: {context}\n\nQuery: {query}"},
             ],
             temperature=0.4,  # Slightly higher for personality
@@ -217,45 +281,31 @@ def demonstrate_detailed_personas():
     query = "SELECT * FROM user_activity WHERE session_duration > 3600"
     context = "Analyzing user engagement patterns"
 
-    personas = {
-        "Alex Chen": {
-            "title": "Senior Data Engineer",
-            "company": "TechCorp",
-            "experience": "12 years in high-scale systems",
-            "specialties": [
-                "Real-time analytics",
-                "Stream processing",
-                "Data pipelines",
-            ],
-            "previous_roles": ["Netflix", "Uber", "Airbnb"],
-            "achievements": "Built analytics platform handling 1B events/day",
-            "style": "Direct and practical, focuses on scalability",
-            "risk_tolerance": "Conservative with production changes",
-            "concerns": ["Performance", "Reliability", "Cost optimization"],
-        },
-        "Morgan Taylor": {
-            "title": "Lead Security Engineer",
-            "company": "SecureFinance",
-            "experience": "8 years in financial services security",
-            "specialties": ["SQL injection prevention", "Data privacy", "Compliance"],
-            "previous_roles": ["JPMorgan Chase", "Goldman Sachs"],
-            "achievements": "Zero security incidents in 3 years",
-            "style": "Methodical and thorough, questions everything",
-            "risk_tolerance": "Extremely risk-averse",
-            "concerns": ["Security", "Compliance", "Audit trails"],
-        },
-    }
-
     print("=== DETAILED PERSONA ANALYSIS ===\n")
     print(f"Query: {query}")
     print(f"Context: {context}")
     print("=" * 60)
 
-    for name, background in personas.items():
+    with ThreadPoolExecutor(max_workers=len(PERSONAS)) as executor:
+        futures = [
+            executor.submit(
+                create_persona_with_background(name, background), query, context
+            )
+            for name, background in PERSONAS.items()
+        ]
+
+    for (name, background), future in zip(PERSONAS.items(), futures, strict=True):
         print(f"\n--- {name.upper()} ({background['title']}) ---")
-        analyzer = create_persona_with_background(name, background)
+        verbose_tokens, prompt_tokens = (
+            token_counter(
+                model=GPT_OSS_20B,
+                messages=[{"role": "system", "content": build(name, background)}],
+            )
+            for build in (verbose_persona_prompt, persona_prompt)
+        )
+        print(f"Persona prompt: {prompt_tokens} tokens (was {verbose_tokens})")
         try:
-            result = analyzer(query, context)
+            result = future.result()
             blue_print(result)
         except Exception as e:
             print(f"Error: {e}")
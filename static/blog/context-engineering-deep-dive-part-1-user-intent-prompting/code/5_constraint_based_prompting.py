@@ -5,57 +5,83 @@ This script demonstrates how to use strict constraints and rules
 to get reliable, predictable outputs from LLMs.
 """
 
-import json
-from os import getenv
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from string import Template
+
+import orjson
+
+from _common import (
+    GPT_OSS_20B,
+    blue_print,
+    cached_completion,
+    json_dumps,
+    routing_hints,
+    stream_completion,
+)
+
+# Prompt templates are built once at import. Static rules come first so every
+# call shares a byte-identical, cacheable prefix; only the request-specific
+# tail is substituted per call.
+MIGRATION_CONSTRAINTS = """HARD CONSTRAINTS (MUST follow):
+- Use transactions for all DDL operations
+- Include rollback statements
+- Add IF EXISTS checks
+- Maximum 5 operations per transaction
+- Include timing estimates as comments
+
+FORBIDDEN:
+- Direct table drops without backups
+- Changing primary keys
+- Removing columns without deprecation notice
+- Operations without explicit transaction boundaries
+
+REQUIRED FORMAT:
+- Start with migration metadata comment
+- Each operation in separate transaction
+- Rollback script at the end
+"""
+
+MIGRATION_PROMPT = Template("""$constraints
+Output format: Valid SQL with comments
+
+Generate a migration script for these changes:
+$changes
+""")
 
-from dotenv import load_dotenv
-from litellm import completion
+QUERY_PROMPT = Template("""$constraints
+VIOLATION OF ANY CONSTRAINT WILL RESULT IN REJECTION.
 
+Return only valid SQL that follows ALL constraints.
+$context
+Generate SQL query for: $request
+""")
 
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
+JSON_QUERY_PROMPT = Template("""$constraints
+RETURN ONLY VALID JSON:
+{
+    "query": "SQL query here",
+    "explanation": "brief explanation",
+    "estimated_cost": "low|medium|high",
+    "confidence": 0.95
+}
 
+NO OTHER TEXT ALLOWED.
 
-# Load environment variables
-load_dotenv()
+Generate SQL query for: $request
+""")
 
 
 def generate_migration_script(changes: dict) -> str:
-    """Generate database migration with strict constraints"""
-
-    constraints = """
-    HARD CONSTRAINTS (MUST follow):
-    - Use transactions for all DDL operations
-    - Include rollback statements
-    - Add IF EXISTS checks
-    - Maximum 5 operations per transaction
-    - Include timing estimates as comments
-
-    FORBIDDEN:
-    - Direct table drops without backups
-    - Changing primary keys
-    - Removing columns without deprecation notice
-    - Operations without explicit transaction boundaries
-
-    REQUIRED FORMAT:
-    - Start with migration metadata comment
-    - Each operation in separate transaction
-    - Rollback script at the end
-    """
-
-    prompt = f"""
-    Generate a migration script for these changes:
-    {json.dumps(changes, indent=2)}
-
-    {constraints}
-
-    Output format: Valid SQL with comments
-    """
-
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    """Generate database migration with strict constraints, streamed as it is written"""
+
+    prompt = MIGRATION_PROMPT.substitute(
+        constraints=MIGRATION_CONSTRAINTS, changes=json_dumps(changes, indent=True)
+    )
+
+    return stream_completion(
+        model=GPT_OSS_20B,
         messages=[
             {
                 "role": "system",
@@ -64,39 +90,37 @@ def generate_migration_script(changes: dict) -> str:
             {"role": "user", "content": prompt},
         ],
         temperature=0.1,  # Low temperature for consistency
+        **routing_hints(MIGRATION_CONSTRAINTS),
     )
 
-    return response["choices"][0]["message"]["content"]
+
+def format_constraints(rules: dict) -> str:
+    """Render business rules as a MANDATORY CONSTRAINTS prompt block"""
+
+    return "MANDATORY CONSTRAINTS:\n" + "".join(
+        f"\n{category.upper()}:\n" + "".join(f"  - {rule}\n" for rule in rule_list)
+        for category, rule_list in rules.items()
+    )
 
 
 def create_constrained_query_generator(rules: dict):
     """Create a query generator with specific business rules"""
 
-    def generate_query(request: str, context: dict | None = None) -> str:
-        constraints_text = "MANDATORY CONSTRAINTS:\n"
-        for category, rule_list in rules.items():
-            constraints_text += f"\n{category.upper()}:\n"
-            for rule in rule_list:
-                constraints_text += f"  - {rule}\n"
+    # The rules are fixed for the generator's lifetime: render them once
+    constraints_text = format_constraints(rules)
+    hints = routing_hints(constraints_text)
 
+    def generate_query(request: str, context: dict | None = None) -> str:
         context_text = ""
         if context:
-            context_text = f"\nCONTEXT:\n{json.dumps(context, indent=2)}\n"
-
-        prompt = f"""
-        Generate SQL query for: {request}
+            context_text = f"\nCONTEXT:\n{json_dumps(context, indent=True)}\n"
 
-        {constraints_text}
-        {context_text}
-
-        VIOLATION OF ANY CONSTRAINT WILL RESULT IN REJECTION.
-
-        Return only valid SQL that follows ALL constraints.
-        """
+        prompt = QUERY_PROMPT.substitute(
+            constraints=constraints_text, context=context_text, request=request
+        )
 
-        response = completion(
-            model="openrouter/openai/gpt-oss-20b:free",
-            api_key=getenv("OPENROUTER_API_KEY"),
+        response = cached_completion(
+            model=GPT_OSS_20B,
             messages=[
                 {
                     "role": "system",
@@ -105,6 +129,7 @@ def create_constrained_query_generator(rules: dict):
                 {"role": "user", "content": prompt},
             ],
             temperature=0.0,  # Zero temperature for maximum consistency
+            **hints,
         )
 
         return response["choices"][0]["message"]["content"]
@@ -112,8 +137,9 @@ def create_constrained_query_generator(rules: dict):
     return generate_query
 
 
+@cache
 def create_security_constrained_generator():
-    """Generator with strict security constraints"""
+    """Generator with strict security constraints, built once per process"""
 
     security_rules = {
         "security": [
@@ -140,8 +166,9 @@ def create_security_constrained_generator():
     return create_constrained_query_generator(security_rules)
 
 
+@cache
 def create_performance_constrained_generator():
-    """Generator focused on performance constraints"""
+    """Generator focused on performance constraints, built once per process"""
 
     performance_rules = {
         "optimization": [
@@ -168,12 +195,9 @@ def create_performance_constrained_generator():
     return create_constrained_query_generator(performance_rules)
 
 
-def validate_constraint_adherence():
-    """Test how well the model follows constraints"""
+def test_migration_generation():
+    """Test migration script generation under hard constraints"""
 
-    print("=== CONSTRAINT ADHERENCE TEST ===\n")
-
-    # Test migration generation
     print("--- Migration Script Generation ---")
     migration_changes = {
         "add_table": "user_preferences",
@@ -181,12 +205,14 @@ def validate_constraint_adherence():
         "add_index": "idx_user_preferences_user_id",
     }
 
-    migration_script = generate_migration_script(migration_changes)
     print("Generated Migration:")
-    blue_print(migration_script)
+    generate_migration_script(migration_changes)
     print("-" * 50)
 
-    # Test security constraints
+
+def test_security_generator():
+    """Test query generation under security constraints"""
+
     print("\n--- Security Constrained Generator ---")
     security_gen = create_security_constrained_generator()
 
@@ -195,10 +221,19 @@ def validate_constraint_adherence():
         "Get user login history",
     ]
 
-    for request in security_requests:
+    # Requests are independent network calls, so run them side by side
+    with ThreadPoolExecutor(max_workers=len(security_requests)) as executor:
+        futures = [
+            executor.submit(
+                security_gen, request, {"max_results": 100, "user_role": "admin"}
+            )
+            for request in security_requests
+        ]
+
+    for request, future in zip(security_requests, futures, strict=True):
         print(f"\nRequest: {request}")
         try:
-            result = security_gen(request, {"max_results": 100, "user_role": "admin"})
+            result = future.result()
             print("Generated Query:")
             blue_print(result)
         except Exception as e:
@@ -206,7 +241,10 @@ def validate_constraint_adherence():
 
     print("-" * 50)
 
-    # Test performance constraints
+
+def test_performance_generator():
+    """Test query generation under performance constraints"""
+
     print("\n--- Performance Constrained Generator ---")
     perf_gen = create_performance_constrained_generator()
 
@@ -216,16 +254,32 @@ def validate_constraint_adherence():
         "Generate monthly sales report",
     ]
 
-    for request in perf_requests:
+    with ThreadPoolExecutor(max_workers=len(perf_requests)) as executor:
+        futures = [
+            executor.submit(perf_gen, request, {"reporting_period": "last_30_days"})
+            for request in perf_requests
+        ]
+
+    for request, future in zip(perf_requests, futures, strict=True):
         print(f"\nRequest: {request}")
         try:
-            result = perf_gen(request, {"reporting_period": "last_30_days"})
+            result = future.result()
             print("Generated Query:")
             blue_print(result)
         except Exception as e:
             print(f"Error: {e}")
 
 
+def validate_constraint_adherence():
+    """Test how well the model follows constraints"""
+
+    print("=== CONSTRAINT ADHERENCE TEST ===\n")
+
+    test_migration_generation()
+    test_security_generator()
+    test_performance_generator()
+
+
 def demonstrate_constraint_enforcement():
     """Show how constraints prevent unwanted outputs"""
 
@@ -248,6 +302,9 @@ def demonstrate_constraint_enforcement():
         ],
     }
 
+    constraints_text = format_constraints(format_rules)
+    hints = routing_hints(constraints_text)
+
     print("Testing format constraints:")
     requests = [
         "Count active users",
@@ -259,31 +316,13 @@ def demonstrate_constraint_enforcement():
         print(f"\nRequest: {request}")
         try:
             # Override the generator to force JSON format
-            constraints_text = "MANDATORY CONSTRAINTS:\n"
-            for category, rule_list in format_rules.items():
-                constraints_text += f"\n{category.upper()}:\n"
-                for rule in rule_list:
-                    constraints_text += f"  - {rule}\n"
-
-            prompt = f"""
-            Generate SQL query for: {request}
-
-            {constraints_text}
-
-            RETURN ONLY VALID JSON:
-            {{
-                "query": "SQL query here",
-                "explanation": "brief explanation",
-                "estimated_cost": "low|medium|high",
-                "confidence": 0.95
-            }}
-
-            NO OTHER TEXT ALLOWED.
-            """
-
-            response = completion(
-                model="openrouter/openai/gpt-oss-20b:free",
-                api_key=getenv("OPENROUTER_API_KEY"),
+            prompt = JSON_QUERY_PROMPT.substitute(
+                constraints=constraints_text, request=request
+            )
+
+            print("JSON Output:")
+            result = stream_completion(
+                model=GPT_OSS_20B,
                 messages=[
                     {
                         "role": "system",
@@ -292,17 +331,14 @@ def demonstrate_constraint_enforcement():
                     {"role": "user", "content": prompt},
                 ],
                 temperature=0.0,
+                **hints,
             )
 
-            result = response["choices"][0]["message"]["content"]
-            print("JSON Output:")
-            blue_print(result)
-
             # Try to parse as JSON to validate
             try:
-                json.loads(result)
+                orjson.loads(result)
                 print("✓ Valid JSON format")
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print("✗ Invalid JSON format")
 
         except Exception as e:
@@ -330,10 +366,15 @@ def test_boundary_conditions():
         "Find similar records using fuzzy matching across all tables",
     ]
 
-    for request in difficult_requests:
+    with ThreadPoolExecutor(max_workers=len(difficult_requests)) as executor:
+        futures = [
+            executor.submit(conflict_gen, request) for request in difficult_requests
+        ]
+
+    for request, future in zip(difficult_requests, futures, strict=True):
         print(f"Challenging request: {request}")
         try:
-            result = conflict_gen(request)
+            result = future.result()
             print("Response:")
             blue_print(result)
         except Exception as e:
@@ -342,17 +383,37 @@ def test_boundary_conditions():
 
 
 if __name__ == "__main__":
+    demos = {
+        "migration": test_migration_generation,
+        "security": test_security_generator,
+        "perf": test_performance_generator,
+        "enforce": demonstrate_constraint_enforcement,
+        "boundary": test_boundary_conditions,
+    }
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--demo",
+        choices=["all", *demos],
+        default="all",
+        help="run a single demo instead of all of them",
+    )
+    args = parser.parse_args()
+
     print("Constraint-Based Prompting Demo\n")
 
-    # Test basic constraint adherence
-    validate_constraint_adherence()
+    if args.demo != "all":
+        demos[args.demo]()
+    else:
+        # Test basic constraint adherence
+        validate_constraint_adherence()
 
-    print("\n" + "=" * 80 + "\n")
+        print("\n" + "=" * 80 + "\n")
 
-    # Demonstrate format enforcement
-    demonstrate_constraint_enforcement()
+        # Demonstrate format enforcement
+        demonstrate_constraint_enforcement()
 
-    print("\n" + "=" * 80 + "\n")
+        print("\n" + "=" * 80 + "\n")
 
-    # Test edge cases
-    test_boundary_conditions()
+        # Test edge cases
+        test_boundary_conditions()
@@ -3,43 +3,57 @@ Structured Output: Force reliable JSON responses from LLMs
 
 This script demonstrates techniques to get consistently formatted,
 parseable outputs instead of messy text responses.
-"""
 
-import json
-from os import getenv
+Extraction and schema-constrained calls default to a small, fast model.
+The schema only guarantees the shape of the answer, not its quality, so
+the analysis, audit and performance demos pass model= to use a larger one.
+"""
 
-from dotenv import load_dotenv
-from litellm import completion
+import argparse
+import asyncio
+from string import Template
 
+import fastjsonschema
 
-def blue_print(text):
-    """Print text in blue color"""
-    print(f"\033[94m{text}\033[0m")
+from _common import (
+    GPT_OSS_20B,
+    LLAMA_3B,
+    acached_json_completion,
+    blue,
+    json_dumps,
+    json_loads,
+    routing_hints,
+    stream_completion,
+)
 
+DEFAULT_JSON_MODEL = LLAMA_3B
 
-# Load environment variables
-load_dotenv()
+# Built once at import; the rules sit ahead of the text so extractions with
+# the same schema share a cacheable prompt prefix
+EXTRACTION_PROMPT = Template("""Extract information and return ONLY valid JSON matching this schema:
 
+Schema: $schema
 
-def extract_structured_data(text: str, schema: dict) -> dict:
-    """Extract structured data with guaranteed format"""
+Rules:
+- Return ONLY the JSON object, no explanation
+- Use null for missing values
+- Validate types match the schema
 
-    format_prompt = f"""
-    Extract information and return ONLY valid JSON matching this schema:
+Text: $text
+""")
 
-    Schema: {json.dumps(schema, indent=2)}
 
-    Text: {text}
+def extract_structured_data(
+    text: str, schema: dict, model: str = DEFAULT_JSON_MODEL
+) -> dict:
+    """Extract structured data with guaranteed format, streaming the raw JSON"""
 
-    Rules:
-    - Return ONLY the JSON object, no explanation
-    - Use null for missing values
-    - Validate types match the schema
-    """
+    format_prompt = EXTRACTION_PROMPT.substitute(
+        schema=json_dumps(schema, indent=True), text=text
+    )
 
-    response = completion(
-        model="openrouter/openai/gpt-oss-20b:free",
-        api_key=getenv("OPENROUTER_API_KEY"),
+    return stream_completion(
+        model=model,
         messages=[
             {
                 "role": "system",
@@ -48,91 +62,126 @@ def extract_structured_data(text: str, schema: dict) -> dict:
             {"role": "user", "content": format_prompt},
         ],
         temperature=0,  # Zero temperature for deterministic output
+        response_format={"type": "json_object"},
+        parse=json_loads,
     )
 
-    return json.loads(response["choices"][0]["message"]["content"])
 
+def to_json_schema(example):
+    """Translate a tutorial-style example schema into real JSON Schema
 
-def create_json_enforcer(output_schema: dict, max_retries: int = 3):
-    """Create a function that enforces JSON output with retries"""
+    Lists describe arrays of strings, nested dicts describe objects, and
+    string hints like "low|medium|high", "boolean", "integer 1-10" or
+    "float between 0 and 1" pick the value type. A hint ending in "or null"
+    also allows null, one starting with "any" accepts every JSON value, and
+    any other hint becomes a described string.
+    """
 
-    def enforce_json_output(prompt: str, system_message: str | None = None) -> dict:
-        """Enforce JSON output with automatic retries on parse failures"""
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {key: to_json_schema(hint) for key, hint in example.items()},
+            "required": list(example),
+            "additionalProperties": False,
+        }
+    if isinstance(example, list):
+        return {"type": "array", "items": {"type": "string"}, "description": example[0]}
+    if example.startswith("any"):
+        return {"description": example}
+    if example.endswith(" or null"):
+        schema = to_json_schema(example.removesuffix(" or null"))
+        schema["type"] = [schema["type"], "null"]
+        if "enum" in schema:
+            schema["enum"] = [*schema["enum"], None]
+        return schema
+    if "|" in example and " " not in example:
+        return {"type": "string", "enum": example.split("|")}
+    if example.startswith("boolean"):
+        return {"type": "boolean"}
+    if "integer" in example:
+        return {"type": "integer", "description": example}
+    if example.startswith("float"):
+        return {"type": "number", "description": example}
+    return {"type": "string", "description": example}
+
+
+def _is_fully_typed(schema: dict) -> bool:
+    """Whether every node carries a type, as strict structured outputs require"""
+    children = [*schema.get("properties", {}).values()]
+    if "items" in schema:
+        children.append(schema["items"])
+    return "type" in schema and all(map(_is_fully_typed, children))
+
+
+def create_json_enforcer(output_schema: dict, model: str = DEFAULT_JSON_MODEL):
+    """Create a function that returns JSON matching output_schema"""
+
+    json_schema = to_json_schema(output_schema)
+
+    # Constrained decoding: the provider only samples tokens that keep the
+    # output valid against the schema, so there is nothing to retry or clean up.
+    # Strict mode rejects untyped ("any") nodes, so those schemas are a hint only.
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "output",
+            "schema": json_schema,
+            "strict": _is_fully_typed(json_schema),
+        },
+    }
 
-        json_prompt = f"""
-        {prompt}
+    # Compiled once into plain Python checks, then run on every response
+    validate = fastjsonschema.compile(json_schema)
 
-        CRITICAL: Return ONLY valid JSON matching this exact schema:
-        {json.dumps(output_schema, indent=2)}
+    schema_line = json_dumps(json_schema)
+    hints = routing_hints(schema_line)
 
-        Rules:
-        - NO explanatory text
-        - NO markdown formatting
-        - NO code blocks
-        - ONLY the JSON object
-        - ALL required fields must be present
-        """
+    async def enforce_json_output(
+        prompt: str, system_message: str | None = None
+    ) -> dict:
+        """Run the prompt with schema-constrained decoding and parse the result"""
 
         system_msg = (
             system_message or "You are a JSON-only API. Return only valid JSON."
         )
-
-        for attempt in range(max_retries):
-            try:
-                response = completion(
-                    model="openrouter/openai/gpt-oss-20b:free",
-                    api_key=getenv("OPENROUTER_API_KEY"),
-                    messages=[
-                        {"role": "system", "content": system_msg},
-                        {"role": "user", "content": json_prompt},
-                    ],
-                    temperature=0.1,
-                )
-
-                result_text = response["choices"][0]["message"]["content"].strip()
-
-                # Try to clean common formatting issues
-                if result_text.startswith("```json"):
-                    result_text = (
-                        result_text.replace("```json", "").replace("```", "").strip()
-                    )
-                elif result_text.startswith("```"):
-                    result_text = result_text.replace("```", "").strip()
-
-                # Parse and validate
-                parsed = json.loads(result_text)
-
-                # Basic schema validation
-                if validate_schema(parsed, output_schema):
-                    return parsed
-                else:
-                    raise ValueError("Schema validation failed")
-
-            except (json.JSONDecodeError, ValueError) as e:
-                if attempt == max_retries - 1:
-                    raise Exception(
-                        f"Failed to get valid JSON after {max_retries} attempts: {e}"
-                    ) from e
-
-                # Add more explicit instructions for retry
-                json_prompt += f"\n\nATTEMPT {attempt + 2}: Previous attempt failed. Return ONLY valid JSON."
-
-        return None
+        # Spelled out as well, for providers that ignore response_format
+        system_msg += f"\n\nSchema: {schema_line}"
+
+        # Defensive: not every upstream provider honours response_format, so
+        # the reply is checked against the schema spelled out above, and a
+        # reply that fails the check is never cached
+        return await acached_json_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.1,
+            response_format=response_format,
+            parse=lambda text: validate(json_loads(text)),
+            **hints,
+        )
 
     return enforce_json_output
 
 
-def validate_schema(data: dict, schema: dict) -> bool:
-    """Basic schema validation"""
+def render_section(title, label, result_label, inputs, results) -> str:
+    """Render one demo's results as text, so concurrent demos never interleave"""
 
-    if not isinstance(data, dict):
-        return False
+    lines = ["=" * 80 + "\n", f"=== {title} ===\n"]
+    for i, (shown_input, result) in enumerate(zip(inputs, results, strict=True), 1):
+        lines.append(f"--- {label} {i} ---")
+        lines.append(shown_input)
+        if isinstance(result, Exception):
+            lines.append(f"Error: {result}")
+        else:
+            lines.append(f"{result_label}:")
+            lines.append(blue(json_dumps(result, indent=True)))
+        lines.append("")
+    return "\n".join(lines)
 
-    # Check required keys exist
-    return all(key in data for key in schema)
 
-
-def demonstrate_query_analysis():
+async def demonstrate_query_analysis() -> str:
     """Demonstrate structured query analysis"""
 
     analysis_schema = {
@@ -145,7 +194,7 @@ def demonstrate_query_analysis():
         "confidence_score": "float between 0 and 1",
     }
 
-    enforcer = create_json_enforcer(analysis_schema)
+    enforcer = create_json_enforcer(analysis_schema, model=GPT_OSS_20B)
 
     queries_to_analyze = [
         """
@@ -168,28 +217,28 @@ def demonstrate_query_analysis():
         """,
     ]
 
-    print("=== STRUCTURED QUERY ANALYSIS ===\n")
-
-    for i, query in enumerate(queries_to_analyze, 1):
-        print(f"--- Analysis {i} ---")
-        print(f"Query: {query.strip()}")
-
-        try:
-            result = enforcer(
+    # Each analysis is an independent network call, so run them side by side
+    results = await asyncio.gather(
+        *(
+            enforcer(
                 f"Analyze this SQL query and provide structured output: {query}",
                 "You are a SQL analysis API that returns only JSON.",
             )
+            for query in queries_to_analyze
+        ),
+        return_exceptions=True,
+    )
 
-            print("Analysis:")
-            blue_print(json.dumps(result, indent=2))
-            print()
-
-        except Exception as e:
-            print(f"Error: {e}")
-            print()
+    return render_section(
+        "STRUCTURED QUERY ANALYSIS",
+        "Analysis",
+        "Analysis",
+        [f"Query: {query.strip()}" for query in queries_to_analyze],
+        results,
+    )
 
 
-def demonstrate_security_audit():
+async def demonstrate_security_audit() -> str:
     """Demonstrate structured security audit output"""
 
     security_schema = {
@@ -202,7 +251,7 @@ def demonstrate_security_audit():
         "audit_score": "integer 1-10",
     }
 
-    security_enforcer = create_json_enforcer(security_schema)
+    security_enforcer = create_json_enforcer(security_schema, model=GPT_OSS_20B)
 
     vulnerable_queries = [
         "SELECT * FROM users WHERE username = '" + "user_input" + "'",
@@ -211,28 +260,27 @@ def demonstrate_security_audit():
         "UPDATE users SET admin = 1 WHERE user_id = " + "user_controlled_id",
     ]
 
-    print("=== STRUCTURED SECURITY AUDIT ===\n")
-
-    for i, query in enumerate(vulnerable_queries, 1):
-        print(f"--- Security Audit {i} ---")
-        print(f"Query: {query}")
-
-        try:
-            result = security_enforcer(
+    results = await asyncio.gather(
+        *(
+            security_enforcer(
                 f"Perform a security audit on this SQL query: {query}",
                 "You are a security audit API that identifies vulnerabilities and returns only JSON.",
             )
+            for query in vulnerable_queries
+        ),
+        return_exceptions=True,
+    )
 
-            print("Security Audit:")
-            blue_print(json.dumps(result, indent=2))
-            print()
-
-        except Exception as e:
-            print(f"Error: {e}")
-            print()
+    return render_section(
+        "STRUCTURED SECURITY AUDIT",
+        "Security Audit",
+        "Security Audit",
+        [f"Query: {query}" for query in vulnerable_queries],
+        results,
+    )
 
 
-def demonstrate_performance_report():
+async def demonstrate_performance_report() -> str:
     """Demonstrate structured performance reporting"""
 
     performance_schema = {
@@ -249,7 +297,7 @@ def demonstrate_performance_report():
         "optimization_priority": "low|medium|high",
     }
 
-    perf_enforcer = create_json_enforcer(performance_schema)
+    perf_enforcer = create_json_enforcer(performance_schema, model=GPT_OSS_20B)
 
     performance_queries = [
         """
@@ -272,28 +320,27 @@ def demonstrate_performance_report():
         """,
     ]
 
-    print("=== STRUCTURED PERFORMANCE REPORT ===\n")
-
-    for i, query in enumerate(performance_queries, 1):
-        print(f"--- Performance Report {i} ---")
-        print(f"Query: {query.strip()}")
-
-        try:
-            result = perf_enforcer(
+    results = await asyncio.gather(
+        *(
+            perf_enforcer(
                 f"Analyze the performance characteristics of this query: {query}",
                 "You are a database performance analysis API that returns only JSON.",
             )
+            for query in performance_queries
+        ),
+        return_exceptions=True,
+    )
 
-            print("Performance Report:")
-            blue_print(json.dumps(result, indent=2))
-            print()
-
-        except Exception as e:
-            print(f"Error: {e}")
-            print()
+    return render_section(
+        "STRUCTURED PERFORMANCE REPORT",
+        "Performance Report",
+        "Performance Report",
+        [f"Query: {query.strip()}" for query in performance_queries],
+        results,
+    )
 
 
-def test_edge_cases():
+async def test_edge_cases() -> str:
     """Test edge cases and error handling"""
 
     simple_schema = {
@@ -311,30 +358,29 @@ def test_edge_cases():
         "",  # Empty input
     ]
 
-    print("=== EDGE CASES TEST ===\n")
-
-    for i, edge_case in enumerate(edge_cases, 1):
-        print(f"--- Edge Case {i} ---")
-        print(f"Input: '{edge_case}'")
-
-        try:
-            result = edge_enforcer(
-                edge_case, "Handle any input and return structured JSON response."
+    results = await asyncio.gather(
+        *(
+            edge_enforcer(
+                edge_case,
+                "Handle any input and return structured JSON response.",
             )
+            for edge_case in edge_cases
+        ),
+        return_exceptions=True,
+    )
 
-            print("Response:")
-            blue_print(json.dumps(result, indent=2))
-            print()
-
-        except Exception as e:
-            print(f"Error: {e}")
-            print()
+    return render_section(
+        "EDGE CASES TEST",
+        "Edge Case",
+        "Response",
+        [f"Input: '{edge_case}'" for edge_case in edge_cases],
+        results,
+    )
 
 
-if __name__ == "__main__":
-    print("Structured Output Demo\n")
+def demonstrate_basic_extraction():
+    """Demonstrate basic structured data extraction"""
 
-    # Basic structured data extraction
     schema = {
         "tables": ["list of table names"],
         "operations": ["list of SQL operations"],
@@ -346,25 +392,47 @@ if __name__ == "__main__":
     print("=== BASIC EXTRACTION ===")
     print(f"Input: {query_text}")
     try:
-        result = extract_structured_data(query_text, schema)
         print("Extracted:")
-        blue_print(json.dumps(result, indent=2))
+        extract_structured_data(query_text, schema)
     except Exception as e:
         print(f"Error: {e}")
 
-    print("\n" + "=" * 80 + "\n")
+    print()
 
-    # Comprehensive demonstrations
-    demonstrate_query_analysis()
 
-    print("=" * 80 + "\n")
+async def run_demonstrations(*demos):
+    """Run the async demos concurrently, then print their sections in order"""
 
-    demonstrate_security_audit()
+    for section in await asyncio.gather(*(demo() for demo in demos)):
+        print(section)
 
-    print("=" * 80 + "\n")
 
-    demonstrate_performance_report()
+if __name__ == "__main__":
+    async_demos = {
+        "analysis": demonstrate_query_analysis,
+        "audit": demonstrate_security_audit,
+        "perf": demonstrate_performance_report,
+        "edge": test_edge_cases,
+    }
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--demo",
+        choices=["all", "extraction", *async_demos],
+        default="all",
+        help="run a single demo instead of all of them",
+    )
+    args = parser.parse_args()
+
+    print("Structured Output Demo\n")
 
-    print("=" * 80 + "\n")
+    if args.demo == "extraction":
+        demonstrate_basic_extraction()
+    elif args.demo != "all":
+        asyncio.run(run_demonstrations(async_demos[args.demo]))
+    else:
+        # Basic structured data extraction
+        demonstrate_basic_extraction()
 
-    test_edge_cases()
+        # Comprehensive demonstrations
+        asyncio.run(run_demonstrations(*async_demos.values()))
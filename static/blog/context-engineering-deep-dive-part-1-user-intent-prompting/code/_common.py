@@ -0,0 +1,373 @@
+"""
+Shared helpers for the prompt engineering examples
+
+Responses are cached on disk, so re-running a demo while iterating on the
+blog post returns identical requests in milliseconds instead of paying for
+the same LLM call again.
+
+Every request goes through one pooled keep-alive HTTP client and is retried
+with exponential backoff on rate limits and transient server errors.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from functools import partial
+from os import getenv
+from pathlib import Path
+
+import httpx
+import litellm
+import orjson
+from dotenv import load_dotenv
+from litellm import ModelResponse, acompletion, completion, stream_chunk_builder
+
+# Load environment variables once per process, however many demos import us
+load_dotenv()
+
+# Read once and handed to litellm as the OpenRouter default, so call sites
+# never pass api_key (other providers, e.g. OpenAI batches, keep their own)
+OPENROUTER_API_KEY = getenv("OPENROUTER_API_KEY")
+litellm.openrouter_key = OPENROUTER_API_KEY
+
+GPT_OSS_20B = "openrouter/openai/gpt-oss-20b:free"
+LLAMA_3B = "openrouter/meta-llama/llama-3.2-3b-instruct"
+LLAMA_8B = "openrouter/meta-llama/llama-3.1-8b-instruct"
+LLAMA_70B = "openrouter/meta-llama/llama-3.1-70b-instruct"
+
+CACHE_PATH = Path.home() / ".cache" / "prompt-engineering-examples" / "responses.db"
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+# OpenRouter has no batch endpoint, so --batch runs go to OpenAI directly
+# (needs OPENAI_API_KEY) with this model in place of the interactive one
+BATCH_MODEL = "gpt-4o-mini"
+BATCH_POLL_SECONDS = 30
+
+MAX_ATTEMPTS = 4
+RETRY_INITIAL_WAIT = 1  # seconds, doubled after every failed attempt
+RETRY_MAX_WAIT = 10
+RETRYABLE_ERRORS = (
+    litellm.RateLimitError,
+    litellm.InternalServerError,
+    litellm.ServiceUnavailableError,
+    litellm.APIConnectionError,
+    litellm.Timeout,
+)
+
+# Some models wrap JSON replies in a markdown code fence despite being told not to
+_FENCE_RE = re.compile(r"\A```(?:json)?\s*|\s*```\Z")
+
+# Share keep-alive connections across calls instead of paying a TCP/TLS
+# handshake for every request. Sized so the widest demo fan-out (thread
+# pools and asyncio.gather) reuses warm connections instead of opening more.
+_POOL_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+litellm.client_session = httpx.Client(timeout=60, limits=_POOL_LIMITS)
+litellm.aclient_session = httpx.AsyncClient(timeout=60, limits=_POOL_LIMITS)
+
+
+def blue(text) -> str:
+    """Text wrapped in the escape codes that color it blue"""
+    return "\033[94m" + str(text) + "\033[0m"
+
+
+def blue_print(text):
+    """Print text in blue color"""
+    sys.stdout.write(blue(text) + "\n")
+
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """orjson-backed json.dumps, pretty-printed with 2 spaces on request"""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+
+
+def json_loads(text: str):
+    """Parse a JSON response, tolerating a markdown code fence around it"""
+    return orjson.loads(_FENCE_RE.sub("", text.strip()))
+
+
+def cached_system_message(text: str) -> dict:
+    """System message marked as a prompt-cache breakpoint (Anthropic, Gemini)"""
+    return {
+        "role": "system",
+        "content": [
+            {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+        ],
+    }
+
+
+def routing_hints(stable_prefix: str) -> dict:
+    """Completion kwargs that pin calls sharing a prompt prefix to one replica
+
+    Providers route each request independently, so a perfectly ordered prefix
+    can still land on a replica with a cold prompt cache. A stable user id
+    and session-affinity header derived from the prefix keep related calls
+    on the same one.
+    """
+    key = hashlib.sha1(stable_prefix.encode(), usedforsecurity=False).hexdigest()[:16]
+    return {"user": key, "extra_headers": {"x-session-affinity": key}}
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the response cache, creating it on first use"""
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, response_json TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def _canonical_content(content):
+    """Message text without whitespace that cannot change the answer"""
+    if not isinstance(content, str):
+        return content
+    return "\n".join(line.rstrip() for line in content.strip().splitlines())
+
+
+def _cache_key(kwargs: dict) -> str:
+    """Hash everything that shapes the response (the API key does not)"""
+    payload = {key: value for key, value in kwargs.items() if key != "api_key"}
+    payload.setdefault("temperature", 1.0)
+    if "messages" in payload:
+        payload["messages"] = [
+            {**message, "content": _canonical_content(message.get("content"))}
+            for message in payload["messages"]
+        ]
+    serialized = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return hashlib.md5(serialized, usedforsecurity=False).hexdigest()
+
+
+def _cache_get(key: str) -> ModelResponse | None:
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT response_json, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+    if row is None or time.time() - row[1] > CACHE_TTL_SECONDS:
+        return None
+    return ModelResponse(**orjson.loads(row[0]))
+
+
+def _cache_set(key: str, response: ModelResponse) -> None:
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+            (key, response.model_dump_json(), time.time()),
+        )
+
+
+def _retry_wait(attempt: int) -> float:
+    """Exponential backoff with jitter, capped at RETRY_MAX_WAIT"""
+    return min(RETRY_MAX_WAIT, RETRY_INITIAL_WAIT * 2**attempt + random.uniform(0, 1))
+
+
+def _completion(**kwargs):
+    """litellm.completion, retried on rate limits and transient errors"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return completion(**kwargs)
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(_retry_wait(attempt))
+
+
+async def _acompletion(**kwargs):
+    """litellm.acompletion, retried on rate limits and transient errors"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return await acompletion(**kwargs)
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(_retry_wait(attempt))
+
+
+def cached_completion(**kwargs) -> ModelResponse:
+    """litellm.completion with an on-disk, exact-match response cache"""
+    key = _cache_key(kwargs)
+    response = _cache_get(key)
+    if response is None:
+        response = _completion(**kwargs)
+        _cache_set(key, response)
+    return response
+
+
+def stream_completion(parse=None, **kwargs):
+    """Print the response in blue as it is generated and return its text
+
+    Cached responses are printed at once; fresh ones are streamed token by
+    token and then cached like any other response. With parse=, the text is
+    returned through it and a reply it rejects raises instead of being cached.
+    """
+    key = _cache_key(kwargs)
+    response = _cache_get(key)
+    if response is not None:
+        text = response["choices"][0]["message"]["content"]
+        blue_print(text)
+        return parse(text) if parse else text
+
+    chunks = []
+    sys.stdout.write("\033[94m")
+    for chunk in _completion(**kwargs, stream=True):
+        chunks.append(chunk)
+        sys.stdout.write(chunk.choices[0].delta.content or "")
+        sys.stdout.flush()
+    sys.stdout.write("\033[0m\n")
+
+    response = stream_chunk_builder(chunks, messages=kwargs["messages"])
+    text = response["choices"][0]["message"]["content"]
+    result = parse(text) if parse else text
+    _cache_set(key, response)
+    return result
+
+
+async def acached_completion(**kwargs) -> ModelResponse:
+    """Async counterpart of cached_completion"""
+    key = _cache_key(kwargs)
+    response = _cache_get(key)
+    if response is None:
+        response = await _acompletion(**kwargs)
+        _cache_set(key, response)
+    return response
+
+
+class _JsonObjectScanner:
+    """Find where the first top-level JSON object ends in streamed text
+
+    Counts braces outside of string literals, so a "}" inside a value does
+    not end the object early. Text before the opening brace is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> int | None:
+        """Index just past the closing brace if it is in text, else None"""
+        for index, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return index + 1
+        return None
+
+
+async def acached_json_completion(parse=None, **kwargs):
+    """Text of the first JSON object in the response, cached like any other
+
+    The response is streamed and the stream is closed as soon as the
+    top-level object is complete, so any prose the model writes after the
+    JSON is never generated or paid for. If the stream ends first, whatever
+    arrived is returned for the caller's parser to reject, and not cached.
+    As with stream_completion, parse= is applied before caching, so a reply
+    it rejects raises instead of being cached.
+    """
+    key = _cache_key(kwargs)
+    response = _cache_get(key)
+    if response is not None:
+        text = response["choices"][0]["message"]["content"]
+        return parse(text) if parse else text
+
+    chunks, parts = [], []
+    end = None
+    scanner = _JsonObjectScanner()
+    stream = await _acompletion(**kwargs, stream=True)
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            delta = chunk.choices[0].delta.content or ""
+            end = scanner.feed(delta)
+            parts.append(delta if end is None else delta[:end])
+            if end is not None:
+                break
+    finally:
+        await stream.aclose()
+
+    text = "".join(parts)
+    text = text[max(text.find("{"), 0) :]  # drop any preamble or code fence
+    result = parse(text) if parse else text
+    if end is not None:
+        response = stream_chunk_builder(chunks, messages=kwargs["messages"])
+        response.choices[0].message.content = text
+        _cache_set(key, response)
+    return result
+
+
+def run_batch(requests: dict[str, dict]) -> dict[str, str | Exception]:
+    """Run chat requests through the OpenAI Batch API, keyed by custom_id
+
+    Half the price of interactive calls and free of rate limits, at the cost
+    of latency: the batch can take up to 24 hours. Requests that fail come
+    back as exceptions rather than aborting the whole batch.
+    """
+    lines = [
+        orjson.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {**body, "model": BATCH_MODEL},
+            }
+        )
+        for custom_id, body in requests.items()
+    ]
+    batch_file = litellm.create_file(
+        file=("batch.jsonl", b"\n".join(lines)),
+        purpose="batch",
+        custom_llm_provider="openai",
+    )
+    batch = litellm.create_batch(
+        completion_window="24h",
+        endpoint="/v1/chat/completions",
+        input_file_id=batch_file.id,
+        custom_llm_provider="openai",
+    )
+
+    print(f"Submitted batch {batch.id}, polling every {BATCH_POLL_SECONDS}s...")
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = litellm.retrieve_batch(batch_id=batch.id, custom_llm_provider="openai")
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    results: dict[str, str | Exception] = {
+        custom_id: RuntimeError("No result returned") for custom_id in requests
+    }
+    if batch.output_file_id:
+        output = litellm.file_content(
+            file_id=batch.output_file_id, custom_llm_provider="openai"
+        )
+        for line in output.text.splitlines():
+            record = orjson.loads(line)
+            if record.get("error"):
+                results[record["custom_id"]] = RuntimeError(record["error"]["message"])
+            else:
+                body = record["response"]["body"]
+                results[record["custom_id"]] = body["choices"][0]["message"]["content"]
+    return results
+
+
+# Per-model entry points with the model pre-bound, so call sites only pass
+# what actually varies: messages, temperature, response format
+gpt_oss = partial(cached_completion, model=GPT_OSS_20B)
+gpt_oss_stream = partial(stream_completion, model=GPT_OSS_20B)
+llama_70b_stream = partial(stream_completion, model=LLAMA_70B)